@@ -3,45 +3,214 @@ My Target Site Portal Login Script
 This script automates the login process for the target site portal using Playwright and AgentQL.
 """
 
+import atexit
+import functools
 import logging
-from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
 import agentql
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import sync_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
 import os
+import sys
+import time
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 
+# Browser profile reused between runs so cookies and cache survive
+PROFILE_DIR = os.path.expanduser("~/.cache/agentql-profile")
+
+# Cookies that indicate the portal session from a previous run is still present
+SESSION_COOKIES = ("AspNet.ApplicationCookie", ".AspNetCore.Identity.Application", "AuthCookie")
+
+# Page opened once the portal session is established
+SEARCH_BUYERS_URL = "https://portal.my_target_site.com/exhibitor/search-buyers"
+
+# AgentQL queries live at module scope so they are built once, not on every login
+
+# Updated login form query with exact selectors based on provided JSON details
+_LOGIN_FORM_QUERY = """
+{
+    body {
+        username_field "input#username[name='Username'][class='form-control'][placeholder='Username']"
+        password_field "input#password[name='Password'][class='form-control'][type='password'][placeholder='Password']"
+        login_button "button#submit[data-dtm='policebox_login'][class='btn btn-primary login-button']"
+    }
+}
+"""
+
+# Post-login popup and Exhibitor Hub queries combined so they cost one AgentQL round trip
+_POST_LOGIN_QUERY = """
+{
+    popup_form {
+        close_btn
+    }
+    submit_btn "a[href='/exhibitor/challenge'][class='_button_1p0fh_8 _--primary_1p0fh_136 _--theme-default_1p0fh_80']"
+    submit_btn_text "Log in to the Exhibitor Hub"
+}
+"""
+
+# Exhibitor Hub query on its own, used to look the button up again once the popup is gone
+_EXHIBITOR_HUB_QUERY = """
+{
+    submit_btn "a[href='/exhibitor/challenge'][class='_button_1p0fh_8 _--primary_1p0fh_136 _--theme-default_1p0fh_80']"
+}
+"""
+
+# Resource types and tracker hosts dropped when BLOCK_HEAVY_ASSETS=1
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS = ("google-analytics.com", "googletagmanager.com", "doubleclick.net", "facebook.net", "hotjar.com")
+
+# Playwright driver shared by every login in this process
+_PW = None
+
+# Set once Playwright's own Chromium executable has been found on disk
+_browsers_ready = False
+
 # Configure logging
-logging.basicConfig(
-    filename=f'login_my_target_site_{datetime.now().strftime("%Y%m%d")}.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+_LOG = logging.getLogger("agentql_login")
+if not _LOG.handlers:
+    # Rolls over at midnight so long-running sessions log to the right day's file
+    _handler = TimedRotatingFileHandler("login_my_target_site.log", when="midnight", utc=False)
+    _handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    _LOG.addHandler(_handler)
+    _LOG.setLevel(logging.INFO)
 
-def read_default_credentials(env_path: str = '.env') -> tuple:
+@functools.lru_cache(maxsize=None)
+def _load_env(env_path: str) -> tuple:
     """
-    Reads default credentials from environment variables.
+    Loads the .env file once per path and returns the credentials it provides.
 
     Args:
-        env_path (str): Path to the .env file. Defaults to '.env'
+        env_path (str): Path to the .env file
 
     Returns:
         tuple: Contains URL, username, and password
     """
-    # Load environment variables from .env file
     if not os.path.exists(env_path):
-        logging.warning(f"{env_path} file not found. Creating template...")
+        _LOG.warning("%s file not found. Creating template...", env_path)
         with open(env_path, 'w') as f:
             f.write("TARGET_URL=\nTARGET_USERNAME=\nTARGET_PASSWORD=")
-        logging.info(f"Created {env_path} template. Please fill in your credentials.")
+        _LOG.info("Created %s template. Please fill in your credentials.", env_path)
         return "", "", ""
 
-    load_dotenv(env_path)
+    load_dotenv(env_path, override=False)
     
-    url = os.getenv('TARGET_URL')
-    username = os.getenv('TARGET_USERNAME')
-    password = os.getenv('TARGET_PASSWORD')
-    
-    return url, username, password
+    env = os.environ
+    return env.get('TARGET_URL', ''), env.get('TARGET_USERNAME', ''), env.get('TARGET_PASSWORD', '')
+
+def clear_env_cache() -> None:
+    """
+    Forgets cached .env results so the next read parses the file again.
+    """
+    _load_env.cache_clear()
+
+def read_default_credentials(env_path: str = '.env') -> tuple:
+    """
+    Reads default credentials from environment variables.
+
+    Args:
+        env_path (str): Path to the .env file. Defaults to '.env'
+
+    Returns:
+        tuple: Contains URL, username, and password
+    """
+    # The .env file is only parsed on the first call for a given path
+    return _load_env(env_path)
+
+def _chromium_ready(playwright) -> bool:
+    """
+    Checks once whether the Chromium build Playwright expects is installed.
+
+    Args:
+        playwright: Running Playwright instance
+
+    Returns:
+        bool: True if Playwright's Chromium executable exists
+    """
+    global _browsers_ready
+    if not _browsers_ready:
+        # executable_path follows Playwright's own lookup rules, including PLAYWRIGHT_BROWSERS_PATH
+        _browsers_ready = os.path.exists(playwright.chromium.executable_path)
+    return _browsers_ready
+
+def _get_playwright():
+    """
+    Starts the Playwright driver on first use and reuses it afterwards.
+
+    Returns:
+        Playwright: Running Playwright instance, stopped at interpreter exit
+
+    Raises:
+        RuntimeError: If no Chromium build is installed
+    """
+    global _PW
+    if _PW is None:
+        _PW = sync_playwright().start()
+        atexit.register(_PW.stop)
+    if not _chromium_ready(_PW):
+        raise RuntimeError(
+            f"Chromium not found at {_PW.chromium.executable_path}. Run 'playwright install chromium' first."
+        )
+    return _PW
+
+def _wait_until_closed(page) -> None:
+    """
+    Blocks until the browser page is closed or the user presses Ctrl+C.
+
+    Args:
+        page: Playwright page to wait on
+    """
+    # The close event has already fired, so waiting for it would never return
+    if page.is_closed():
+        return
+    try:
+        # A single event subscription instead of polling the page every second
+        page.wait_for_event("close", timeout=0)
+    except KeyboardInterrupt:
+        pass
+    except PlaywrightError:
+        # Browser disconnected before the page emitted its close event
+        pass
+
+def _block_heavy_assets(route) -> None:
+    """
+    Aborts requests for assets the login flow does not need.
+
+    Args:
+        route: Playwright route for the intercepted request
+    """
+    request = route.request
+    hostname = urlparse(request.url).hostname or ""
+    blocked_host = any(hostname == host or hostname.endswith("." + host) for host in BLOCKED_HOSTS)
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or blocked_host:
+        route.abort()
+    else:
+        route.continue_()
+
+def _has_session_cookie(context, url: str) -> bool:
+    """
+    Checks whether the browser profile already holds a valid portal session cookie.
+
+    Args:
+        context: Playwright browser context
+        url (str): Portal URL the cookies are scoped to
+
+    Returns:
+        bool: True if any session cookie is present and valid for at least another minute
+    """
+    valid_until = time.time() + 60
+    return any(
+        c["name"] in SESSION_COOKIES and c.get("expires", 0) > valid_until
+        for c in context.cookies(url)
+    )
+
+def _is_noninteractive() -> bool:
+    """
+    Checks whether the script should run without prompting for input.
+
+    Returns:
+        bool: True if AGENTQL_NONINTERACTIVE=1 is set or stdin is missing or not a terminal
+    """
+    return os.environ.get("AGENTQL_NONINTERACTIVE") == "1" or sys.stdin is None or not sys.stdin.isatty()
 
 def get_user_credentials() -> tuple:
     """
@@ -52,7 +221,13 @@ def get_user_credentials() -> tuple:
     """
     url, username, password = read_default_credentials()
     
-    if not all([url, username, password]):
+    # Scheduled and CI runs use the .env values as-is instead of blocking on input()
+    if _is_noninteractive():
+        if url and username and password:
+            _LOG.info("Non-interactive run, using credentials from .env file")
+        return url, username, password
+
+    if not (url and username and password):
         print("\nCredentials not found in .env file.")
         print("Please enter your credentials or update the .env file with:")
         print("TARGET_URL=your_url")
@@ -82,148 +257,184 @@ def get_user_credentials() -> tuple:
 
     return url, username, password
 
-def login_to_portal(url: str, username: str, password: str) -> None:
+def validate_credentials(url: str, username: str, password: str) -> None:
     """
-    Performs login operation on the target site portal.
+    Checks credentials before the browser is started.
 
     Args:
         url (str): Portal URL
         username (str): Login username
         password (str): Login password
-    """
 
-    # Updated Exhibitor Hub queries with XPath
-    EXHIBITOR_HUB_QUERY = """
-    {
-        submit_btn "a[href='/exhibitor/challenge'][class='_button_1p0fh_8 _--primary_1p0fh_136 _--theme-default_1p0fh_80']"
-        submit_btn_text "Log in to the Exhibitor Hub"
-    }
+    Raises:
+        ValueError: If the URL is not an http(s) URL or a credential is empty
     """
+    parsed = urlparse(url or "")
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        raise ValueError(f"Invalid portal URL: {url!r}")
+    if not username or not password:
+        raise ValueError("Username and password are required")
 
-
-    # Updated login form query with exact selectors based on provided JSON details
-    LOGIN_FORM_QUERY = """
-    {
-        body {
-            username_field "input#username[name='Username'][class='form-control'][placeholder='Username']"
-            password_field "input#password[name='Password'][class='form-control'][type='password'][placeholder='Password']"
-            login_button "button#submit[data-dtm='policebox_login'][class='btn btn-primary login-button']"
-        }
-    }
+def login_to_portal(url: str, username: str, password: str) -> None:
     """
+    Performs login operation on the target site portal.
 
-    # Query for handling popup
-    POPUP_QUERY = """
-    {
-        popup_form {
-            close_btn
-        }
-    }
+    Args:
+        url (str): Portal URL
+        username (str): Login username
+        password (str): Login password
     """
+    # Fail on bad input before paying for the Chromium startup
+    validate_credentials(url, username, password)
 
+    # Outside the try so a missing Chromium reaches main() instead of only the log file
+    _LOG.info("Initializing Playwright")
+    playwright = _get_playwright()
 
+    # Also outside the try: a profile locked by another open run has to reach main() too
+    context = playwright.chromium.launch_persistent_context(
+        user_data_dir=PROFILE_DIR,
+        headless=False,
+        accept_downloads=False
+    )
 
+    page = None
     try:
-        logging.info("Initializing Playwright")
-        playwright = sync_playwright().start()
-        browser = playwright.chromium.launch(headless=False)
-        context = browser.new_context()
-        page = agentql.wrap(context.new_page())
-        
-        logging.info(f"Navigating directly to login page: {url}")
-        page.goto(url)
-        
-        # Wait for page load
-        logging.info("Waiting for page load")
-        page.wait_for_load_state('networkidle')
-        
-        # Wait for form elements
-        logging.info("Waiting for login form elements")
-        page.wait_for_selector("#username", state="visible", timeout=60000)
-        page.wait_for_selector("#password", state="visible", timeout=60000)
-        logging.info("Login form elements visible")
-
-        logging.info("Attempting to interact with login form")
+        page = agentql.wrap(context.pages[0] if context.pages else context.new_page())
+
+        if os.environ.get("BLOCK_HEAVY_ASSETS") == "1":
+            _LOG.info("Blocking images, fonts, media and analytics requests")
+            page.route("**/*", _block_heavy_assets)
+        
+        # A still-valid session from the persistent profile makes the login flow unnecessary
+        if _has_session_cookie(context, url):
+            _LOG.info("Existing session found, skipping login")
+            page.goto(SEARCH_BUYERS_URL, wait_until="domcontentloaded")
+            # A stale or revoked session lands back on the login page
+            if "/Login" not in page.url:
+                _LOG.info("Browser will remain open. Press Ctrl+C to exit.")
+                _wait_until_closed(page)
+                return
+            _LOG.info("Session was not accepted by the portal, logging in again")
+
+        _LOG.info("Navigating directly to login page: %s", url)
+        # The login form selectors below are the real readiness gate
+        page.goto(url, wait_until="domcontentloaded")
+        
+        # Direct selectors match the known form; AgentQL is only needed if the page changes
+        _LOG.info("Attempting to interact with login form")
+        username_field = page.locator("#username[name='Username']")
+        password_field = page.locator("#password[name='Password']")
+        login_button = page.locator("button#submit[data-dtm='policebox_login']")
         try:
-            response = page.query_elements(LOGIN_FORM_QUERY)
-            logging.info("Login form elements found")
-            
-            logging.info(f"Filling username: {username}")
-            response.username_field.fill(username)
-            
-            logging.info("Filling password")
-            response.password_field.fill(password)
-            
-            logging.info("Clicking submit button")
-            response.body.login_button.click()
-            
-        except Exception as form_error:
-            logging.warning(f"AgentQL query failed for login form: {str(form_error)}")
-            logging.info("Attempting fallback with direct selectors")
-            
-            logging.info("Filling username field")
-            page.locator("#username[name='Username']").fill(username)
-            
-            logging.info("Filling password field")
-            page.locator("#password[name='Password']").fill(password)
-            
-            logging.info("Clicking submit button")
-            page.locator("button#submit[data-dtm='policebox_login']").click()
+            # fill() waits for the field to be visible and enabled, so no separate wait is needed
+            _LOG.info("Filling username: %s", username)
+            username_field.fill(username, timeout=5000)
+        
+            _LOG.info("Filling password")
+            password_field.fill(password)
+        
+            _LOG.info("Clicking submit button")
+            login_button.click()
+        
+        except PlaywrightTimeoutError:
+            _LOG.warning("Direct selectors failed for login form", exc_info=True)
+            _LOG.info("Attempting fallback with AgentQL query")
+        
+            response = page.query_elements(_LOGIN_FORM_QUERY)
+            form = response.body
+            username_field, password_field, login_button = form.username_field, form.password_field, form.login_button
+            _LOG.info("Login form elements found")
+        
+            _LOG.info("Filling username field")
+            username_field.fill(username)
+        
+            _LOG.info("Filling password field")
+            password_field.fill(password)
+        
+            _LOG.info("Clicking submit button")
+            login_button.click()
 
         # Wait for navigation after login
-        logging.info("Waiting for login submission to complete")
-        page.wait_for_load_state('networkidle')
+        _LOG.info("Waiting for login submission to complete")
+        page.wait_for_url(lambda u: "/Login" not in u, timeout=60000)
         
-        logging.info("Login process completed")
+        _LOG.info("Login process completed")
         
+        # Locate the popup and the Exhibitor Hub button with a single query
+        post_login_response = None
+        try:
+            _LOG.info("Checking for popup and Exhibitor Hub login button")
+            post_login_response = page.query_elements(_POST_LOGIN_QUERY)
+        except Exception:
+            _LOG.warning("Post-login query failed", exc_info=True)
+
+        # Pull the handles out once instead of re-traversing the response
+        popup_form = post_login_response.popup_form if post_login_response else None
+        close_btn = popup_form.close_btn if popup_form else None
+        hub_btn = post_login_response.submit_btn if post_login_response else None
+
         # Handle popup if present
+        popup_closed = False
         try:
-            logging.info("Checking for popup")
-            popup_response = page.query_elements(POPUP_QUERY)
-            if popup_response and popup_response.popup_form.close_btn:
-                logging.info("Popup detected, attempting to close")
-                popup_response.popup_form.close_btn.click()
-                logging.info("Popup closed successfully")
-        except Exception as popup_error:
-            logging.warning(f"No popup found or error handling popup: {str(popup_error)}")
+            if close_btn:
+                _LOG.info("Popup detected, attempting to close")
+                close_btn.click()
+                popup_closed = True
+                _LOG.info("Popup closed successfully")
+        except Exception:
+            _LOG.warning("No popup found or error handling popup", exc_info=True)
 
         # Try to click Exhibitor Hub button
-        try:
-            logging.info("Looking for Exhibitor Hub login button")
-            hub_response = page.query_elements(EXHIBITOR_HUB_QUERY)
-            if hub_response and hub_response.submit_btn:
-                logging.info("Exhibitor Hub button found, clicking...")
-                hub_response.submit_btn.click()
-                logging.info("Exhibitor Hub button clicked successfully")
-            else:
-                logging.info("Trying to find button by text...")
-                page.get_by_text(hub_response.submit_btn_text).click()
-                logging.info("Exhibitor Hub button clicked successfully using text selector")
-        except Exception as hub_error:
-            logging.error(f"Failed to find Exhibitor Hub button: {str(hub_error)}")
+        if post_login_response is None:
+            _LOG.warning("Skipping Exhibitor Hub button, post-login query returned nothing")
+        else:
+            try:
+                _LOG.info("Looking for Exhibitor Hub login button")
+                if not hub_btn and popup_closed:
+                    # The popup may have hidden the button from the combined query
+                    _LOG.info("Popup was closed, querying Exhibitor Hub button again")
+                    hub_btn = page.query_elements(_EXHIBITOR_HUB_QUERY).submit_btn
+                if hub_btn:
+                    _LOG.info("Exhibitor Hub button found, clicking...")
+                    try:
+                        hub_btn.click()
+                    except PlaywrightError:
+                        # The handle was resolved while the popup was still open; look it up again
+                        _LOG.warning("Exhibitor Hub button click failed, querying again", exc_info=True)
+                        page.query_elements(_EXHIBITOR_HUB_QUERY).submit_btn.click()
+                    _LOG.info("Exhibitor Hub button clicked successfully")
+                else:
+                    _LOG.info("Trying to find button by text...")
+                    page.get_by_text(post_login_response.submit_btn_text).click()
+                    _LOG.info("Exhibitor Hub button clicked successfully using text selector")
+            except Exception:
+                _LOG.exception("Failed to find Exhibitor Hub button")
 
         # Navigate to search buyers page
-        logging.info("Navigating to search buyers page")
-        page.goto("https://portal.my_target_site.com/exhibitor/search-buyers")
-        page.wait_for_load_state('networkidle')
-        logging.info("Successfully navigated to search buyers page")
+        _LOG.info("Navigating to search buyers page")
+        page.goto(SEARCH_BUYERS_URL, wait_until="domcontentloaded")
+        _LOG.info("Successfully navigated to search buyers page")
 
         # Keep the browser open indefinitely
-        logging.info("Browser will remain open. Press Ctrl+C to exit.")
-        while True:
-            page.wait_for_timeout(1000)  # Check every second
+        _LOG.info("Browser will remain open. Press Ctrl+C to exit.")
+        _wait_until_closed(page)
             
-    except Exception as e:
-        logging.error(f"Error during login process: {str(e)}")
-        logging.error(f"Error details: {str(e.__class__.__name__)}")
+    except Exception:
+        _LOG.exception("Error during login process")
         
         # Keep browser open even if there's an error
-        logging.info("Browser will remain open despite error. Press Ctrl+C to exit.")
-        while True:
-            page.wait_for_timeout(1000)
+        if page is not None and not page.is_closed():
+            _LOG.info("Browser will remain open despite error. Press Ctrl+C to exit.")
+            _wait_until_closed(page)
             
     finally:
-        logging.info("Script execution completed")
+        # Release the profile lock so later logins in this process can reopen PROFILE_DIR
+        try:
+            context.close()
+        except PlaywrightError:
+            _LOG.warning("Browser context was already closed", exc_info=True)
+        _LOG.info("Script execution completed")
 
 def main():
     """
@@ -232,13 +443,13 @@ def main():
     try:
         print("\nMy Target Site Portal Login")
         print("===========================")
-        logging.info("Starting login process")
+        _LOG.info("Starting login process")
         
         url, username, password = get_user_credentials()
-        logging.info("Credentials obtained")
+        _LOG.info("Credentials obtained")
         
-        if not all([url, username, password]):
-            logging.error("Missing required credentials")
+        if not (url and username and password):
+            _LOG.error("Missing required credentials")
             print("Error: All credentials are required")
             return
 
@@ -246,10 +457,10 @@ def main():
         login_to_portal(url, username, password)
         
     except Exception as e:
-        logging.error(f"Main execution failed: {str(e)}")
+        _LOG.exception("Main execution failed")
         print(f"\nError: {str(e)}")
     finally:
-        logging.info("Main function execution completed")
+        _LOG.info("Main function execution completed")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file